@@ -68,18 +68,26 @@ class AmberOFFLibrary(object):
 
         Parameters
         ----------
-        filename : str
-            The name of the file to see if it is an OFF file format
+        filename : str or file-like
+            The name of the file to see if it is an OFF file format. If it is a
+            file-like object, it is returned to its original position after
+            the check
 
         Returns
         -------
         is_fmt : bool
             True if it is recognized as OFF, False otherwise
         """
-        with closing(genopen(filename, 'r')) as f:
-            if AmberOFFLibrary._headerre.match(f.readline()):
-                return True
-            return False
+        if isinstance(filename, string_types):
+            with closing(genopen(filename, 'r')) as f:
+                line = f.readline()
+        else:
+            cur = filename.tell()
+            line = filename.readline()
+            filename.seek(cur)
+        if AmberOFFLibrary._headerre.match(line):
+            return True
+        return False
 
     #===================================================
 
@@ -465,16 +473,15 @@ class AmberOFFLibrary(object):
         dest.write('!entry.%s.unit.atoms table  str name  str type  int typex  '
                    'int resx  int flags  int seq  int elmnt  dbl chg\n' %
                    res.name)
-        for i, r in enumerate(res):
-            for atom in r:
-                dest.write(' "%s" "%s" 0 %d 131072 %d %d %.6f\n' % (atom.name,
-                           atom.type, i+1, atom.idx+1, atom.atomic_number,
-                           atom.charge))
+        # Build each per-atom table in full and hand it to dest in one write
+        dest.write(''.join([' "%s" "%s" 0 %d 131072 %d %d %.6f\n' %
+                            (atom.name, atom.type, i+1, atom.idx+1,
+                             atom.atomic_number, atom.charge)
+                            for i, r in enumerate(res) for atom in r]))
         dest.write('!entry.%s.unit.atomspertinfo table  str pname  str ptype  '
                    'int ptypex  int pelmnt  dbl pchg\n' % res.name)
-        for r in res:
-            for atom in r:
-                dest.write(' "%s" "%s" 0 -1 0.0\n' % (atom.name, atom.type))
+        dest.write(''.join([' "%s" "%s" 0 -1 0.0\n' % (atom.name, atom.type)
+                            for r in res for atom in r]))
         dest.write('!entry.%s.unit.boundbox array dbl\n' % res.name)
         if res.box is None:
             dest.write((' -1.000000\n' + ' 0.0\n' * 4))
@@ -522,9 +529,8 @@ class AmberOFFLibrary(object):
         dest.write(' "%s"\n' % res.name)
         dest.write('!entry.%s.unit.positions table  dbl x  dbl y  dbl z\n' %
                    res.name)
-        for r in res:
-            for atom in r:
-                dest.write(' %.6g %.6g %.6g\n' % (atom.xx, atom.xy, atom.xz))
+        dest.write(''.join([' %.6g %.6g %.6g\n' % (atom.xx, atom.xy, atom.xz)
+                            for r in res for atom in r]))
         dest.write('!entry.%s.unit.residueconnect table  int c1x  int c2x  '
                    'int c3x  int c4x  int c5x  int c6x\n' % res.name)
         c = 1
@@ -31,23 +31,35 @@ class Mol2File(object):
 
         Parameters
         ----------
-        filename : str
-            Name of the file to test whether or not it is a mol2 file
+        filename : str or file-like
+            Name of the file to test whether or not it is a mol2 file. If it is
+            a file-like object, it is returned to its original position after
+            the check
 
         Returns
         -------
         is_fmt : bool
             True if it is a mol2 (or mol3) file, False otherwise
         """
-        f = genopen(filename, 'r')
+        if isinstance(filename, string_types):
+            f = genopen(filename, 'r')
+            own_handle = True
+        else:
+            f = filename
+            own_handle = False
+            cur = f.tell()
         try:
-            for line in f:
-                if line.startswith('#'): continue
-                if not line.strip(): continue
-                return line.startswith('@<TRIPOS>')
+            line = f.readline()
+            while line:
+                if not line.startswith('#') and line.strip():
+                    return line.startswith('@<TRIPOS>')
+                line = f.readline()
             return False
         finally:
-            f.close()
+            if own_handle:
+                f.close()
+            else:
+                f.seek(cur)
 
     #===================================================
 
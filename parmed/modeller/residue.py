@@ -7,6 +7,7 @@ from collections import OrderedDict, defaultdict
 import copy as _copy
 import numpy as np
 import os
+from parmed import unit as u
 from parmed.residue import AminoAcidResidue, RNAResidue, DNAResidue
 from parmed.structure import Structure
 from parmed.topologyobjects import Atom, Bond, AtomList, TrackedList
@@ -282,6 +283,25 @@ class ResidueTemplate(object):
             self._crd = np.array([[a.xx, a.xy, a.xz] for a in self])
         return self._crd
 
+    @coordinates.setter
+    def coordinates(self, value):
+        """ Setting coordinates will also set xx, xy, and xz on the atoms """
+        if value is None:
+            # Wipe out coordinates
+            self.__dict__.pop('_crd', None)
+            for atom in self.atoms:
+                try:
+                    del atom.xx, atom.xy, atom.xz
+                except AttributeError:
+                    pass
+            return
+        if u.is_quantity(value):
+            value = value.value_in_unit(u.angstroms)
+        coords = np.array(value, dtype=np.float64).reshape((len(self), 3))
+        for atom, (x, y, z) in zip(self.atoms, coords.tolist()):
+            atom.xx, atom.xy, atom.xz = x, y, z
+        self._crd = coords
+
     @property
     def empirical_chemical_formula(self):
         """ Return the empirical chemical formula (in Hill notation) as a string (e.g. 'H2O', 'C6H12'), omitting EPs """
@@ -404,6 +424,8 @@ class ResidueTemplate(object):
         """
         if not self.atoms:
             raise ValueError('Cannot fix charges on an empty residue')
+        # Use the same (Python) summation as net_charge so that residues with
+        # an exactly integral net charge are left alone
         net_charge = self.net_charge
         if to is None:
             to = round(net_charge)
@@ -414,11 +436,14 @@ class ResidueTemplate(object):
             return self
 
         smear = (to - net_charge) / len(self)
-        for atom in self:
-            atom.charge = round(atom.charge + smear, precision)
+        charges = np.fromiter((a.charge for a in self.atoms), dtype=np.float64,
+                              count=len(self.atoms))
+        charges = np.round(charges + smear, precision)
 
         # Dump the extra tiny bit (O(10^-precision)) on the first atom
-        self.atoms[0].charge += to - sum(atom.charge for atom in self.atoms)
+        charges[0] += to - sum(charges.tolist())
+        for atom, charge in zip(self.atoms, charges.tolist()):
+            atom.charge = charge
 
         return self
 
@@ -867,8 +892,31 @@ class ResidueTemplateContainer(list):
         """
         if len(self) == 0:
             raise ValueError('Cannot fix charges on an empty container')
-        for res in self:
-            res.fix_charges(precision=precision)
+        natoms = np.array([len(res) for res in self])
+        if not natoms.all():
+            raise ValueError('Cannot fix charges on an empty residue')
+        # Pad every residue out to the size of the largest one so the charges
+        # of the entire container can be fixed with a few array operations
+        mask = np.arange(natoms.max()) < natoms[:, np.newaxis]
+        charges = np.zeros(mask.shape, dtype=np.float64)
+        charges[mask] = [a.charge for res in self for a in res.atoms]
+        # Sum each residue on its own (not over the padded rows) exactly like
+        # ResidueTemplate.fix_charges does, so integral residues are left alone
+        net_charges = np.array([res.net_charge for res in self])
+        targets = np.round(net_charges)
+        needs_fix = net_charges != targets
+        smear = np.where(needs_fix, (targets - net_charges) / natoms, 0)
+        charges = np.where(mask & needs_fix[:, np.newaxis],
+                           np.round(charges + smear[:, np.newaxis], precision),
+                           charges)
+        for res, row, fix, target in zip(self, charges.tolist(),
+                                         needs_fix.tolist(), targets.tolist()):
+            if not fix:
+                continue
+            # Dump the extra tiny bit (O(10^-precision)) on the first atom
+            row[0] += target - sum(row[:len(res)])
+            for atom, charge in zip(res.atoms, row):
+                atom.charge = charge
         return self
 
     def to_library(self):
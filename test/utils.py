@@ -38,6 +38,14 @@ try:
 except ImportError:
     has_lxml = False
 
+# pandas is slow to import, so only check whether it is available. Tests that
+# need it can import it themselves (or let parmed import it lazily)
+try:
+    from importlib.util import find_spec
+except ImportError:
+    from pkgutil import find_loader as find_spec
+has_pandas = find_spec('pandas') is not None
+
 try:
     from string import uppercase
 except ImportError:
@@ -124,6 +132,11 @@ class FileIOTestCase(unittest.TestCase):
         except OSError:
             pass
 
+_TEST_DIR = split(abspath(__file__))[0]
+# get_fn only builds paths (it never touches the filesystem), so its results
+# can be cached for the whole run
+_fn_cache = {}
+
 def get_fn(filename, written=False):
     """
     Gets the full path of the file name for a particular test file
@@ -141,10 +154,16 @@ def get_fn(filename, written=False):
     str
         Name of the test file with the full path location
     """
+    try:
+        return _fn_cache[filename, written]
+    except KeyError:
+        pass
     if written:
-        return join(split(abspath(__file__))[0], 'files', 'writes', filename)
+        fn = join(_TEST_DIR, 'files', 'writes', filename)
     else:
-        return join(split(abspath(__file__))[0], 'files', filename)
+        fn = join(_TEST_DIR, 'files', filename)
+    _fn_cache[filename, written] = fn
+    return fn
 
 def get_saved_fn(filename):
     """